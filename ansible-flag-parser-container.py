@@ -2,49 +2,139 @@
 
 import argparse
 import json
-import yaml
 import os
-import subprocess
 import sys
-import signal
-import re
-import syslog
-import tempfile
 import time
-import shutil
 
-def load_metadata_from_self():
-    """Load metadata by reading YAML directly from the script file itself."""
+# yaml, subprocess, signal, syslog, atexit and hashlib are imported by their
+# callers so that warm (cached metadata) and --help runs don't pay for them
+
+# YAML is embedded after "--- METADATA ---" until "--- END METADATA ---"; the
+# start marker may end a line (e.g. _META = """--- METADATA ---) and the end
+# marker may be followed by other text (e.g. --- END METADATA ---""")
+_METADATA_START = "--- METADATA ---\n"
+_METADATA_END = "--- END METADATA ---"
+
+# Resolved once; the persistent requirements directories live under the cwd
+_CWD = os.getcwd()
+_REQUIREMENTS_DIR = os.path.join(_CWD, "ansible_requirements")
+_ROLES_DIR = os.path.join(_REQUIREMENTS_DIR, "roles")
+_COLLECTIONS_DIR = os.path.join(_REQUIREMENTS_DIR, "collections")
+
+# Syslog level and facility names, overridden from the metadata in main();
+# openlog is deferred until the first message is logged
+syslog_level = "LOG_INFO"
+syslog_priority = "LOG_USER"
+_syslog_opened = False
+
+# A hand-written <script>.meta.yml beside the script, when present, is used
+# instead of the embedded YAML
+_METADATA_SIDECAR = os.path.splitext(__file__)[0] + ".meta.yml"
+
+# Parsed metadata is cached next to the script, keyed by the path, mtime and
+# size of the file it was parsed from
+_METADATA_CACHE = __file__ + ".meta.json"
+
+def read_metadata_cache(source, st):
+    """Return cached metadata if it was built from the current source file, else None."""
+    try:
+        with open(_METADATA_CACHE, 'r') as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if (cached.get("_src") == source and cached.get("_src_mtime") == st.st_mtime
+            and cached.get("_src_size") == st.st_size):
+        return cached.get("metadata")
+    return None
+
+def write_metadata_cache(source, st, metadata):
+    """Atomically write parsed metadata to the cache, ignoring any failure."""
+    temp_cache = f"{_METADATA_CACHE}.{os.getpid()}"
+    try:
+        with open(temp_cache, 'w') as f:
+            json.dump({"_src": source, "_src_mtime": st.st_mtime, "_src_size": st.st_size, "metadata": metadata}, f)
+        os.replace(temp_cache, _METADATA_CACHE)
+    except (OSError, TypeError, ValueError):
+        # The cache is only an optimisation, e.g. the script dir may be read-only
+        if os.path.exists(temp_cache):
+            os.remove(temp_cache)
+
+def read_embedded_metadata():
+    """Return the YAML between the METADATA markers in this script, or None."""
+    lines = []
+    inside = False
     with open(__file__, 'r') as f:
-        content = f.read()
+        for line in f:
+            if not inside:
+                inside = line.endswith(_METADATA_START)
+            elif line.startswith(_METADATA_END):
+                return "".join(lines)
+            else:
+                lines.append(line)
+    return None
 
-    # Use regex to capture YAML embedded after "--- METADATA ---" until "--- END METADATA ---"
-    metadata_match = re.search(r"--- METADATA ---\n(.*?)\n--- END METADATA ---", content, re.DOTALL)
-    if metadata_match:
-        metadata_yaml = metadata_match.group(1)
+def load_metadata_from_self():
+    """Load metadata from the cache, the sidecar YAML or the YAML embedded in the script itself."""
+    try:
+        source, st = _METADATA_SIDECAR, os.stat(_METADATA_SIDECAR)
+    except OSError:
+        source, st = __file__, os.stat(__file__)
+
+    metadata = read_metadata_cache(source, st)
+    if metadata is not None:
+        return metadata
+
+    if source == _METADATA_SIDECAR:
+        with open(_METADATA_SIDECAR, 'r') as f:
+            metadata_yaml = f.read()
+    else:
+        metadata_yaml = read_embedded_metadata()
+
+    if metadata_yaml is not None:
+        import yaml
         try:
-            return yaml.safe_load(metadata_yaml)
+            from yaml import CSafeLoader as Loader
+        except ImportError:
+            from yaml import SafeLoader as Loader
+
+        try:
+            metadata = yaml.load(metadata_yaml, Loader=Loader)
         except yaml.YAMLError as e:
             log_message(f"Error parsing YAML metadata: {e}")
             sys.exit(1)
+        # Normalise the flags once, the cache then stores them ready for parse_flags
+        metadata["_flags"] = normalize_flags(metadata)
+        write_metadata_cache(source, st, metadata)
+        return metadata
     else:
         log_message("No metadata found in the script.")
         sys.exit(1)
 
+def normalize_flags(metadata):
+    """Flatten the flag definitions into (flag, help, required, default) tuples."""
+    return [
+        (flag, properties.get("help", ""), properties.get("required", False), properties.get("default", None))
+        for flag, properties in metadata.items()
+        if not flag.startswith('_')  # Skip internal variables
+    ]
+
 def parse_flags(metadata):
     """Parse flags from the metadata."""
+    flags = metadata.get("_flags")
+    if flags is None:
+        flags = normalize_flags(metadata)
+
+    # With no arguments and no required flags argparse would only return the defaults
+    if len(sys.argv) == 1 and not any(required for _, _, required, _ in flags):
+        defaults = {flag.replace('-', '_'): default for flag, _, _, default in flags}
+        return argparse.Namespace(**defaults, no_ctrlc=False, rescuer=False)
+
     parser = argparse.ArgumentParser(description="Flag parser for ansible-playbook")
 
     # Define flags based on metadata
-    for flag, properties in metadata.items():
-        if flag.startswith('_'):  # Skip internal variables
-            continue
-        parser.add_argument(
-            f"--{flag}",
-            help=properties.get("help", ""),
-            required=properties.get("required", False),
-            default=properties.get("default", None),
-        )
+    for flag, help_text, required, default in flags:
+        parser.add_argument(f"--{flag}", help=help_text, required=required, default=default)
 
     # Extra flag for CTRL+C handling and rescuer playbook
     parser.add_argument("--no-ctrlc", action="store_true", help="Disable CTRL+C trapping.")
@@ -54,34 +144,90 @@ def parse_flags(metadata):
 
 def set_env_vars(env_vars):
     """Set environment variables based on metadata."""
-    for key, value in env_vars.items():
-        os.environ[key] = str(value)
+    os.environ.update((key, value if isinstance(value, str) else str(value)) for key, value in env_vars.items())
 
 def disable_ctrlc():
     """Disable CTRL+C trapping if --no-ctrlc is set."""
+    import signal
     signal.signal(signal.SIGINT, signal.SIG_IGN)
 
-def write_temp_requirements_file(galaxy_requirements):
-    """Write galaxy requirements to a temporary file and return the file path."""
+def requirements_digest(galaxy_requirements):
+    """Return a stable hash of the galaxy requirements from the metadata."""
+    import hashlib
+    return hashlib.sha256(json.dumps(galaxy_requirements, sort_keys=True).encode()).hexdigest()
+
+def write_requirements_file(galaxy_requirements, requirements_file):
+    """Write galaxy requirements to the given file and return the file path."""
+    # The file name carries the content hash, so an existing file is already up to date
+    if os.path.exists(requirements_file):
+        return requirements_file
+
+    import yaml
+    try:
+        from yaml import CSafeDumper as Dumper
+    except ImportError:
+        from yaml import SafeDumper as Dumper
+
+    # Write beside the final path and rename, so a concurrent run never sees a partial file
+    temp_file = f"{requirements_file}.{os.getpid()}"
     try:
-        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".yml")
-        with open(temp_file.name, 'w') as f:
-            yaml.dump(galaxy_requirements, f)
-        return temp_file.name
+        with open(temp_file, 'w') as f:
+            yaml.dump(galaxy_requirements, f, Dumper=Dumper)
+        os.replace(temp_file, requirements_file)
+        return requirements_file
     except yaml.YAMLError as e:
-        log_message(f"Error writing YAML to temporary requirements file: {e}")
+        log_message(f"Error writing YAML to requirements file: {e}")
         sys.exit(1)
 
-def install_requirements(container_engine, container_image, requirements_file, roles_dir, collections_dir):
-    """Install required Ansible roles and collections persistently in the container using shared volumes."""
-    command = [
-        container_engine, "run", "--rm",
-        "-v", f"{roles_dir}:/root/.ansible/roles",
-        "-v", f"{collections_dir}:/root/.ansible/collections",
-        "-v", f"{os.getcwd()}:/workspace",
+def exit_on_signal(signum, frame):
+    """Exit normally on SIGTERM/SIGHUP so that atexit cleanup still runs."""
+    sys.exit(128 + signum)
+
+def container_run_options(roles_dir, collections_dir):
+    """Return the volume and workdir options shared by every container run."""
+    return [
+        "-v", f"{roles_dir}:/root/.ansible/roles",  # Mount roles dir for persistent roles
+        "-v", f"{collections_dir}:/root/.ansible/collections",  # Mount collections dir for persistent collections
+        "-v", f"{_CWD}:/workspace",
         "-w", "/workspace",
+    ]
+
+def start_container(container_engine, container_image, roles_dir, collections_dir):
+    """Start one long-lived container for this run and return its name; it is removed at exit."""
+    import atexit
+    import signal
+    import subprocess
+    container = f"ansible-flag-parser-{os.getpid()}"
+
+    # sleep runs as PID 1 and ignores SIGTERM, so stop with KILL rather than
+    # letting "rm --force" wait out the engine's stop timeout
+    command = [
+        container_engine, "run", "--detach", "--rm", "--name", container, "--stop-signal", "KILL",
+    ] + container_run_options(roles_dir, collections_dir) + [
         container_image,
-        "ansible-galaxy", "install", "-r", requirements_file,
+        "sleep", "infinity",
+    ]
+
+    # "sleep infinity" never exits so --rm never fires; remove the container at exit,
+    # and turn SIGTERM/SIGHUP into a normal exit because atexit does not run on them
+    atexit.register(subprocess.run, [container_engine, "rm", "--force", container],
+                    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    signal.signal(signal.SIGTERM, exit_on_signal)
+    signal.signal(signal.SIGHUP, exit_on_signal)
+
+    log_message(f"Starting container {container} from {container_image}...")
+    returncode = subprocess.run(command, stdout=subprocess.DEVNULL).returncode
+    if returncode:
+        log_message(f"Starting container {container} FAILED with exit code {returncode}")
+        sys.exit(returncode)
+    return container
+
+def install_requirements(container_engine, container, requirements_file):
+    """Install required Ansible roles and collections persistently in the container using shared volumes."""
+    import subprocess
+    command = [
+        container_engine, "exec", container,
+        "ansible-galaxy", "install", "--force", "-r", requirements_file,
         "--roles-path", "/root/.ansible/roles",
         "--collections-path", "/root/.ansible/collections"
     ]
@@ -90,7 +236,13 @@ def install_requirements(container_engine, container_image, requirements_file, r
 
 def log_message(message):
     """Log a message to syslog based on syslog settings in the metadata."""
-    syslog.syslog(syslog_level | syslog_priority, message)
+    global _syslog_opened
+    import syslog
+    facility = getattr(syslog, syslog_priority)
+    if not _syslog_opened:
+        syslog.openlog(logoption=syslog.LOG_PID, facility=facility)
+        _syslog_opened = True
+    syslog.syslog(getattr(syslog, syslog_level) | facility, message)
 
 def main():
     # Load metadata from the script itself
@@ -99,14 +251,17 @@ def main():
     # Parse arguments based on metadata
     args = parse_flags(metadata)
 
-    # Initialize syslog with specified level and priority
+    import subprocess
+
+    # Syslog with specified level and priority
     global syslog_level, syslog_priority
-    syslog_level = getattr(syslog, metadata.get("syslog_level", "LOG_INFO"))
-    syslog_priority = getattr(syslog, metadata.get("syslog_priority", "LOG_USER"))
-    syslog.openlog(logoption=syslog.LOG_PID, facility=syslog_priority)
+    syslog_level = metadata.get("syslog_level", syslog_level)
+    syslog_priority = metadata.get("syslog_priority", syslog_priority)
 
-    # Log script arguments at start
-    log_message(f"Script called with arguments: {sys.argv}")
+    # Log script arguments at start, unless syslog_quiet folds them into the completion message
+    syslog_quiet = metadata.get("syslog_quiet", False)
+    if not syslog_quiet:
+        log_message(f"Script called with arguments: {sys.argv}")
 
     # Track start time for execution timing
     start_time = time.time()
@@ -120,7 +275,7 @@ def main():
     set_env_vars(env_vars)
 
     # Prepare extra vars and options for ansible-playbook
-    extra_vars = {flag: getattr(args, flag) for flag in vars(args)}
+    extra_vars = dict(vars(args))
 
     # Determine whether to use ansible-playbook or ansible-navigator
     use_ansible_navigator = metadata.get("use_ansible_navigator", False)
@@ -128,50 +283,65 @@ def main():
     container_engine = metadata.get("container_engine", "podman")  # Default to podman if not specified
     container_image = metadata.get("container_image", "quay.io/ansible/ansible-runner")  # Default image
 
-    # Create a temporary directory for Ansible roles and collections
-    requirements_dir = tempfile.mkdtemp()
-    roles_dir = os.path.join(requirements_dir, "roles")
-    collections_dir = os.path.join(requirements_dir, "collections")
-    os.makedirs(roles_dir, exist_ok=True)
-    os.makedirs(collections_dir, exist_ok=True)
+    # Persistent directory for Ansible roles and collections, reused between runs
+    requirements_dir, roles_dir, collections_dir = _REQUIREMENTS_DIR, _ROLES_DIR, _COLLECTIONS_DIR
+
+    # The directories usually exist already, checking them is cheaper than makedirs
+    if not (os.path.isdir(roles_dir) and os.path.isdir(collections_dir)):
+        os.makedirs(roles_dir, exist_ok=True)
+        os.makedirs(collections_dir, exist_ok=True)
+
+    # Only started when requirements need installing, the playbook then runs in it too
+    container = None
 
     # Check if galaxy requirements need to be installed
     galaxy_requirements = metadata.get("galaxy_requirements", None)
     if galaxy_requirements:
-        requirements_file = write_temp_requirements_file(galaxy_requirements)
+        digest = requirements_digest(galaxy_requirements)
+        # Stamp both install targets, so wiping either one forces a reinstall. The
+        # directories are shared between runs, so ansible-galaxy is always run with
+        # --force or it would keep an already installed role at its old version
+        installed_stamps = [os.path.join(path, f".installed-{digest}") for path in (roles_dir, collections_dir)]
+
+        if all(os.path.exists(stamp) for stamp in installed_stamps):
+            log_message("Ansible requirements already installed, skipping ansible-galaxy")
+        else:
+            requirements_file = write_requirements_file(
+                galaxy_requirements, os.path.join(requirements_dir, f"req-{digest}.yml")
+            )
 
-        try:
             if use_container:
-                # Install requirements persistently in the container
-                install_requirements(container_engine, container_image, requirements_file, roles_dir, collections_dir)
+                # Install requirements persistently in the container, the file is under /workspace
+                container = start_container(container_engine, container_image, roles_dir, collections_dir)
+                install_requirements(container_engine, container, os.path.relpath(requirements_file, _CWD))
             else:
                 # Install requirements locally, specifying paths for roles and collections
                 command = [
-                    "ansible-galaxy", "install", "-r", requirements_file,
+                    "ansible-galaxy", "install", "--force", "-r", requirements_file,
                     "--roles-path", roles_dir,
                     "--collections-path", collections_dir
                 ]
                 log_message("Installing Ansible requirements locally...")
                 subprocess.run(command, check=True)
-        finally:
-            # Clean up the temporary requirements file
-            if os.path.exists(requirements_file):
-                os.remove(requirements_file)
+
+            # Only mark as installed once ansible-galaxy has succeeded
+            for stamp in installed_stamps:
+                open(stamp, 'w').close()
 
     # Construct the command based on whether ansible-navigator or ansible-playbook is used
+    extra_vars_json = json.dumps(extra_vars, separators=(",", ":"), default=str)
     if use_ansible_navigator:
-        base_command = ["ansible-navigator", "run", __file__, "--extra-vars", json.dumps(extra_vars)]
+        base_command = ["ansible-navigator", "run", __file__, "--extra-vars", extra_vars_json]
     else:
-        base_command = ["ansible-playbook", __file__, "-e", json.dumps(extra_vars)]
+        base_command = ["ansible-playbook", __file__, "-e", extra_vars_json]
 
     # If containerized execution is enabled, wrap the command with the container engine
-    if use_container:
+    if container:
+        command = [container_engine, "exec", container] + base_command
+    elif use_container:
         command = [
             container_engine, "run", "--rm",
-            "-v", f"{roles_dir}:/root/.ansible/roles",  # Mount roles dir for persistent roles
-            "-v", f"{collections_dir}:/root/.ansible/collections",  # Mount collections dir for persistent collections
-            "-v", f"{os.getcwd()}:/workspace",
-            "-w", "/workspace",
+        ] + container_run_options(roles_dir, collections_dir) + [
             container_image,
         ] + base_command
     else:
@@ -180,19 +350,19 @@ def main():
     if args.rescuer:
         command.append("--rescuer-playbook")  # Run rescuer if needed
 
-    try:
-        subprocess.run(command, check=True)
-        result = "SUCCESS"
-    except subprocess.CalledProcessError as e:
-        result = f"FAILED with exit code {e.returncode}"
-        sys.exit(e.returncode)
-    finally:
-        # Calculate execution time and log completion
-        execution_time = time.time() - start_time
-        log_message(f"Execution completed in {execution_time:.2f} seconds with result: {result}")
-
-        # Clean up the temporary requirements directory
-        shutil.rmtree(requirements_dir, ignore_errors=True)
+    # Check the return code directly rather than raising CalledProcessError
+    returncode = subprocess.run(command).returncode
+    result = "SUCCESS" if returncode == 0 else f"FAILED with exit code {returncode}"
+
+    # Calculate execution time and log completion
+    execution_time = time.time() - start_time
+    message = f"Execution completed in {execution_time:.2f} seconds with result: {result}"
+    if syslog_quiet:
+        message += f" (arguments: {sys.argv})"
+    log_message(message)
+
+    if returncode:
+        sys.exit(returncode)
 
 if __name__ == "__main__":
     main()
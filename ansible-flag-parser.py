@@ -21,61 +21,139 @@
 
 import argparse
 import json
-import yaml
 import os
-import subprocess
 import sys
-import signal
-import re
 
+# yaml and signal are imported by their callers so that warm (cached
+# metadata) and --help runs don't pay for them
 
+# YAML is embedded after "--- METADATA ---" until "--- END METADATA ---"; the
+# start marker may end a line (e.g. _META = """--- METADATA ---) and the end
+# marker may be followed by other text (e.g. --- END METADATA ---""")
+_METADATA_START = "--- METADATA ---\n"
+_METADATA_END = "--- END METADATA ---"
 
-def load_metadata_from_self():
-    """Load metadata by reading YAML directly from the script file itself."""
+# A hand-written <script>.meta.yml beside the script, when present, is used
+# instead of the embedded YAML
+_METADATA_SIDECAR = os.path.splitext(__file__)[0] + ".meta.yml"
+
+# Parsed metadata is cached next to the script, keyed by the path, mtime and
+# size of the file it was parsed from
+_METADATA_CACHE = __file__ + ".meta.json"
+
+def read_metadata_cache(source, st):
+    """Return cached metadata if it was built from the current source file, else None."""
+    try:
+        with open(_METADATA_CACHE, 'r') as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if (cached.get("_src") == source and cached.get("_src_mtime") == st.st_mtime
+            and cached.get("_src_size") == st.st_size):
+        return cached.get("metadata")
+    return None
+
+def write_metadata_cache(source, st, metadata):
+    """Atomically write parsed metadata to the cache, ignoring any failure."""
+    temp_cache = f"{_METADATA_CACHE}.{os.getpid()}"
+    try:
+        with open(temp_cache, 'w') as f:
+            json.dump({"_src": source, "_src_mtime": st.st_mtime, "_src_size": st.st_size, "metadata": metadata}, f)
+        os.replace(temp_cache, _METADATA_CACHE)
+    except (OSError, TypeError, ValueError):
+        # The cache is only an optimisation, e.g. the script dir may be read-only
+        if os.path.exists(temp_cache):
+            os.remove(temp_cache)
+
+def read_embedded_metadata():
+    """Return the YAML between the METADATA markers in this script, or None."""
+    lines = []
+    inside = False
     with open(__file__, 'r') as f:
-        content = f.read()
+        for line in f:
+            if not inside:
+                inside = line.endswith(_METADATA_START)
+            elif line.startswith(_METADATA_END):
+                return "".join(lines)
+            else:
+                lines.append(line)
+    return None
+
+def load_metadata_from_self():
+    """Load metadata from the cache, the sidecar YAML or the YAML embedded in the script itself."""
+    try:
+        source, st = _METADATA_SIDECAR, os.stat(_METADATA_SIDECAR)
+    except OSError:
+        source, st = __file__, os.stat(__file__)
 
-    # Use regex to capture YAML embedded after "--- METADATA ---" until "--- END METADATA ---"
-    metadata_match = re.search(r"--- METADATA ---\n(.*?)\n--- END METADATA ---", content, re.DOTALL)
-    if metadata_match:
-        metadata_yaml = metadata_match.group(1)
-        return yaml.safe_load(metadata_yaml)
+    metadata = read_metadata_cache(source, st)
+    if metadata is not None:
+        return metadata
+
+    if source == _METADATA_SIDECAR:
+        with open(_METADATA_SIDECAR, 'r') as f:
+            metadata_yaml = f.read()
+    else:
+        metadata_yaml = read_embedded_metadata()
+
+    if metadata_yaml is not None:
+        import yaml
+        try:
+            from yaml import CSafeLoader as Loader
+        except ImportError:
+            from yaml import SafeLoader as Loader
+
+        metadata = yaml.load(metadata_yaml, Loader=Loader)
+        # Normalise the flags once, the cache then stores them ready for parse_flags
+        metadata["_flags"] = normalize_flags(metadata)
+        write_metadata_cache(source, st, metadata)
+        return metadata
     else:
         pass # do we care if there is no meta??
         # raise ValueError("No metadata found in the script.")
 
+def normalize_flags(metadata):
+    """Flatten the flag definitions into (flag, help, required, default) tuples."""
+    return [
+        (flag, properties.get("help", ""), properties.get("required", False), properties.get("default", None))
+        for flag, properties in metadata.items()
+        if not flag.startswith('_')  # Skip internal variables
+    ]
+
 def parse_flags(metadata):
     """Parse flags from the metadata."""
+    flags = metadata.get("_flags")
+    if flags is None:
+        flags = normalize_flags(metadata)
+
+    # With no arguments and no required flags argparse would only return the defaults
+    if len(sys.argv) == 1 and not any(required for _, _, required, _ in flags):
+        defaults = {flag.replace('-', '_'): default for flag, _, _, default in flags}
+        return argparse.Namespace(**defaults, no_ctrlc=False, rescuer=False)
+
     parser = argparse.ArgumentParser(description="Flag parser for ansible-playbook")
 
     # Define flags based on metadata
-    for flag, properties in metadata.items():
-        if flag.startswith('_'):  # Skip internal variables
-            continue
-            
+    for flag, help_text, required, default in flags:
         # @@SGM we will extend this
-        parser.add_argument(
-            f"--{flag}",
-            help=properties.get("help", ""),
-            required=properties.get("required", False),
-            default=properties.get("default", None),
-        )
+        parser.add_argument(f"--{flag}", help=help_text, required=required, default=default)
 
     # Extra flag for CTRL+C handling and rescuer playbook
     
     # @@SGM these should not be exposed but defined from the meta
-    parser.add_argument("--no-ctrl-c", action="store_true", help="Disable CTRL+C trapping.")
+    parser.add_argument("--no-ctrlc", action="store_true", help="Disable CTRL+C trapping.")
     parser.add_argument("--rescuer", action="store_true", help="Execute rescuer playbook on failure.")
 
     return parser.parse_args()
 
 def set_env_vars(env_vars):
     """Set environment variables based on metadata."""
-    for key, value in env_vars.items():
-        os.environ[key] = str(value)
+    os.environ.update((key, value if isinstance(value, str) else str(value)) for key, value in env_vars.items())
 
 def disable_ctrlc():
     """Disable CTRL+C trapping if --no-ctrlc is set."""
+    import signal
     signal.signal(signal.SIGINT, signal.SIG_IGN)
 
 def main():
@@ -94,7 +172,7 @@ def main():
     set_env_vars(env_vars)
 
     # Prepare extra vars and options for ansible-playbook
-    extra_vars = {flag: getattr(args, flag) for flag in vars(args)}
+    extra_vars = dict(vars(args))
     
     # also needs extraflags 
 
@@ -102,15 +180,13 @@ def main():
     command = [
         "ansible-playbook",
         __file__,  # Self-reference as the playbook
-        "-e", json.dumps(extra_vars),
+        "-e", json.dumps(extra_vars, separators=(",", ":"), default=str),
     ]
     if args.rescuer:
         command.append("--rescuer-playbook")  # Run rescuer if needed
 
-    try:
-        subprocess.run(command, check=True)
-    except subprocess.CalledProcessError as e:
-        sys.exit(e.returncode)
+    # Replace this process with ansible-playbook; its exit code becomes ours
+    os.execvp(command[0], command)
 
 if __name__ == "__main__":
     main()